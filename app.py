@@ -4,6 +4,7 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
+from server_session import ServerSessionInterface, DatabaseSessionStore
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -18,11 +19,28 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+# Keep session data server-side; the cookie only carries an opaque id.
+# SESSION_STORE is read on every request and defaults to a table in the main
+# database; MemorySessionStore or SQLiteSessionStore can stand in for tests.
+app.config.setdefault("SESSION_STORE", None)
+app.config.setdefault("SESSION_PERMANENT", True)
+app.config.setdefault("SESSION_REFRESH_INTERVAL", 300)
+app.config.setdefault("SESSION_TOUCH_BATCH_SIZE", 100)
+app.config.setdefault("SESSION_CLEANUP_INTERVAL", 3600)
+# DatabaseSessionStore writes on its own connection while the request still
+# holds one, so admission control budgets two pool connections per request
+app.config.setdefault("ADMISSION_CONNECTIONS_PER_REQUEST", 2)
+app.session_interface = ServerSessionInterface()
+
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
+    # Fewer connections than gunicorn threads, so admission control sheds
+    # the excess instead of letting it queue on the pool
+    "pool_size": 10,
+    "max_overflow": 10,
 }
 
 # Initialize the app with the extension
@@ -32,4 +50,10 @@ with app.app_context():
     # Import models to create tables
     import models  # noqa: F401
     db.create_all()
+    if app.config["SESSION_STORE"] is None:
+        app.config["SESSION_STORE"] = DatabaseSessionStore(db.engine)
     logging.info("Database tables created")
+
+# Autoscaled deployments run several instances, so sessions must be shared
+if os.environ.get("REPLIT_DEPLOYMENT") and not app.config["SESSION_STORE"].shared:
+    raise SystemExit("SESSION_STORE must be shared between instances when deployed")
@@ -0,0 +1,243 @@
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime
+from functools import wraps
+
+import click
+from flask import Response, abort, request, stream_with_context
+from flask_login import current_user
+from sqlalchemy import select
+
+from app import app, db
+from replit_auth import require_login
+from rate_limit import admit, LOW
+from models import User, SOSAlert, CommunityPost, GovernmentScheme, JobOpportunity
+
+# Rows fetched per round trip from the server-side cursor
+YIELD_PER = 1000
+# Output is buffered up to this many bytes before being sent
+CHUNK_SIZE = 64 * 1024
+
+# Each export selects plain columns (no ORM objects) so rows can be dropped as
+# soon as they are written. "date" is the column filtered by since/until,
+# "district" the column filtered by district, and "status" maps each allowed
+# status name to its filter clause. Exports without their own district column join User.
+EXPORTS = {
+    'sos_alerts': {
+        'model': SOSAlert,
+        'columns': [SOSAlert.id, User.district, SOSAlert.latitude, SOSAlert.longitude,
+                    SOSAlert.address, SOSAlert.status, SOSAlert.notes,
+                    SOSAlert.created_at, SOSAlert.resolved_at],
+        'join': (User, SOSAlert.user_id == User.id),
+        'date': SOSAlert.created_at,
+        'district': User.district,
+        'status': {status: SOSAlert.status == status
+                   for status in ('active', 'resolved', 'cancelled')},
+    },
+    # PII-minimised: no id, names, email, phone or profile image
+    'users': {
+        'model': User,
+        'columns': [User.age, User.district, User.preferred_language, User.role, User.created_at],
+        'date': User.created_at,
+        'district': User.district,
+        'status': {role: User.role == role
+                   for role in ('user', 'volunteer', 'moderator', 'admin')},
+    },
+    'community_posts': {
+        'model': CommunityPost,
+        'columns': [CommunityPost.id, User.district, CommunityPost.title, CommunityPost.content,
+                    CommunityPost.category, CommunityPost.is_anonymous, CommunityPost.is_approved,
+                    CommunityPost.reply_count, CommunityPost.created_at],
+        'join': (User, CommunityPost.user_id == User.id),
+        'date': CommunityPost.created_at,
+        'district': User.district,
+        'status': {'approved': CommunityPost.is_approved == True,
+                   'pending': CommunityPost.is_approved == False},
+    },
+    'government_schemes': {
+        'model': GovernmentScheme,
+        'columns': [GovernmentScheme.id, GovernmentScheme.name_en, GovernmentScheme.scheme_type,
+                    GovernmentScheme.applicable_districts, GovernmentScheme.benefits,
+                    GovernmentScheme.contact_info, GovernmentScheme.website_url,
+                    GovernmentScheme.is_active, GovernmentScheme.created_at],
+        'date': GovernmentScheme.created_at,
+        'district': GovernmentScheme.applicable_districts,
+        'status': {'active': GovernmentScheme.is_active == True,
+                   'inactive': GovernmentScheme.is_active == False},
+    },
+    'jobs': {
+        'model': JobOpportunity,
+        'columns': [JobOpportunity.id, JobOpportunity.title, JobOpportunity.company,
+                    JobOpportunity.location, JobOpportunity.district, JobOpportunity.job_type,
+                    JobOpportunity.salary_range, JobOpportunity.application_deadline,
+                    JobOpportunity.is_women_only, JobOpportunity.is_active,
+                    JobOpportunity.created_at],
+        'date': JobOpportunity.created_at,
+        'district': JobOpportunity.district,
+        'status': {'active': JobOpportunity.is_active == True,
+                   'inactive': JobOpportunity.is_active == False},
+    },
+}
+
+# Spreadsheet apps treat cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_date(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def build_export_query(name, since=None, until=None, district=None, status=None):
+    export = EXPORTS[name]
+    stmt = select(*export['columns']).select_from(export['model'])
+    if 'join' in export:
+        stmt = stmt.outerjoin(*export['join'])
+    if since:
+        stmt = stmt.where(export['date'] >= since)
+    if until:
+        stmt = stmt.where(export['date'] < until)
+    if district:
+        if export['district'] is GovernmentScheme.applicable_districts:
+            # Stored as a JSON array of names
+            stmt = stmt.where(export['district'].contains(f'"{district}"', autoescape=True))
+        else:
+            stmt = stmt.where(export['district'] == district)
+    if status:
+        stmt = stmt.where(export['status'][status])
+    return stmt.order_by(export['date'])
+
+
+def _escape_formula(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def iter_export(name, fmt='csv', compress=False, **filters):
+    """Yield the export as byte chunks, holding at most one batch of rows.
+
+    Rows are read through a server-side cursor with ``yield_per`` and the
+    output is gzip-compressed on the fly when ``compress`` is set.
+    """
+    stmt = build_export_query(name, **filters)
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    keys = list(result.keys())
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    try:
+        if fmt == 'csv':
+            writer.writerow(keys)
+        for row in result:
+            if fmt == 'csv':
+                writer.writerow([_escape_formula(value) for value in row])
+            else:
+                buffer.write(json.dumps(dict(zip(keys, row)), default=_json_default))
+                buffer.write('\n')
+            if buffer.tell() >= CHUNK_SIZE:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+    finally:
+        result.close()
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def require_admin(f):
+    @wraps(f)
+    @require_login
+    def decorated_function(*args, **kwargs):
+        if current_user.role != 'admin':
+            abort(403)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+@app.route('/admin/export/<name>')
+@admit(LOW)
+@require_admin
+def admin_export(name):
+    if name not in EXPORTS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, description=f"Unknown format: {fmt}")
+    try:
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'))
+    except ValueError:
+        abort(400, description="since/until must be ISO dates (YYYY-MM-DD)")
+    status = request.args.get('status')
+    if status and status not in EXPORTS[name]['status']:
+        abort(400, description=f"Unknown status for {name}: {status}")
+    compress = request.args.get('gzip') == '1'
+
+    chunks = iter_export(name, fmt, compress,
+                         since=since, until=until,
+                         district=request.args.get('district'),
+                         status=status)
+
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    mimetype = FORMATS[fmt]
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+    })
+
+
+@app.cli.command('export')
+@click.argument('name', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv')
+@click.option('--since', type=click.DateTime(), help='Only rows created on or after this date.')
+@click.option('--until', type=click.DateTime(), help='Only rows created before this date.')
+@click.option('--district')
+@click.option('--status')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Defaults to stdout.')
+def export_command(name, fmt, since, until, district, status, compress, output):
+    """Stream an export of NAME as CSV or NDJSON."""
+    if status and status not in EXPORTS[name]['status']:
+        raise click.BadParameter(
+            f"must be one of {', '.join(EXPORTS[name]['status'])} for {name}", param_hint='--status')
+    chunks = iter_export(name, fmt, compress,
+                         since=since, until=until, district=district, status=status)
+    out = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
@@ -0,0 +1,253 @@
+import json
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_login import current_user
+from markupsafe import escape
+from sqlalchemy.pool import QueuePool
+from werkzeug.exceptions import HTTPException, TooManyRequests
+from werkzeug.wsgi import ClosingIterator
+
+from app import app, db
+
+# Priorities for admission control. SOS traffic is CRITICAL and may use the
+# reserved slots; the forum is LOW and is the first thing shed under load.
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+
+
+class BaseBucketStore:
+    """Backend holding token-bucket state.
+
+    Subclass this to share buckets between workers (e.g. Redis or memcached).
+    ``take`` must be atomic for a given key.
+    """
+
+    def take(self, key, rate, capacity, cost=1):
+        """Try to take ``cost`` tokens from the bucket ``key``.
+
+        Returns 0 if the tokens were taken, otherwise the number of seconds
+        until enough tokens will be available.
+        """
+        raise NotImplementedError
+
+
+class MemoryBucketStore(BaseBucketStore):
+    """Process-local bucket store, used when no shared backend is configured."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._store(key, tokens - cost, now)
+                return 0
+            self._store(key, tokens, now)
+            return (cost - tokens) / rate
+
+    def _store(self, key, tokens, now):
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            self._prune(now)
+        self._buckets[key] = (tokens, now)
+
+    def _prune(self, now):
+        # Drop buckets idle for over an hour; they would be full again anyway.
+        stale = [k for k, (_, updated) in self._buckets.items() if now - updated > 3600]
+        for k in stale:
+            del self._buckets[k]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+
+class AdmissionController:
+    """Bounds concurrent DB-bound requests in a worker to the pool size.
+
+    Only meaningful with threaded workers (see ``--threads`` in .replit); a
+    sync worker runs one request at a time and never fills the slots.
+
+    ``reserved`` slots can only be used by CRITICAL requests, and LOW requests
+    may only run while fewer than ``low_limit`` slots are in use.
+    """
+
+    def __init__(self, slots, reserved, low_limit):
+        self.slots = slots
+        self.reserved = reserved
+        self.low_limit = low_limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    def _limit(self, priority):
+        if priority == CRITICAL:
+            return self.slots
+        if priority == LOW:
+            return min(self.low_limit, self.slots - self.reserved)
+        return self.slots - self.reserved
+
+    def try_acquire(self, priority):
+        with self._lock:
+            if self.in_use >= self._limit(priority):
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+
+
+app.config.setdefault("RATELIMIT_ENABLED", True)
+app.config.setdefault("RATELIMIT_STORAGE", None)
+# None means derived from the engine's pool when the first request arrives
+app.config.setdefault("ADMISSION_SLOTS", None)
+app.config.setdefault("ADMISSION_CONNECTIONS_PER_REQUEST", 1)
+app.config.setdefault("ADMISSION_RESERVED_SLOTS", 3)
+app.config.setdefault("ADMISSION_LOW_PRIORITY_SLOTS", None)
+app.config.setdefault("ADMISSION_RETRY_AFTER", 5)
+
+_local_store = MemoryBucketStore()
+_admission_lock = threading.Lock()
+
+
+def _pool_capacity():
+    pool = db.engine.pool
+    if isinstance(pool, QueuePool):
+        return pool.size() + max(pool._max_overflow, 0)
+    return 10
+
+
+def get_admission_controller():
+    """Build the controller from config and the real pool on first use."""
+    controller = app.extensions.get('admission')
+    if controller is None:
+        with _admission_lock, app.app_context():
+            controller = app.extensions.get('admission')
+            if controller is None:
+                slots = app.config["ADMISSION_SLOTS"] or (
+                    _pool_capacity() // app.config["ADMISSION_CONNECTIONS_PER_REQUEST"])
+                low_limit = app.config["ADMISSION_LOW_PRIORITY_SLOTS"] or slots // 2
+                controller = AdmissionController(slots, app.config["ADMISSION_RESERVED_SLOTS"], low_limit)
+                app.extensions['admission'] = controller
+    return controller
+
+
+def retry_later_response(status, retry_after, message, as_json=False):
+    """Static 429/503 body that needs no template, session or database."""
+    if as_json:
+        response = Response(json.dumps({'success': False, 'error': message}),
+                            status=status, mimetype='application/json')
+    else:
+        response = Response(RETRY_LATER_HTML.format(message=escape(message)),
+                            status=status, mimetype='text/html')
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+RETRY_LATER_HTML = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Please Try Again Shortly - aai Saheb</title></head>
+<body>
+<h1>Please Try Again Shortly</h1>
+<p>{message}</p>
+<p>In an emergency, call 112 or the women's helpline 1091.</p>
+</body>
+</html>
+"""
+
+
+def get_bucket_store():
+    return current_app.config["RATELIMIT_STORAGE"] or _local_store
+
+
+def rate_limit(scope, rate, per, burst=None, per_ip=True, methods=None):
+    """Allow ``rate`` calls every ``per`` seconds per user and, unless
+    ``per_ip`` is False, per IP. Only ``methods`` are counted if given.
+
+    Requests over the limit get a 429 with a ``Retry-After`` header instead of
+    reaching the database.
+    """
+    capacity = burst or rate
+    refill = rate / per
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if current_app.config["RATELIMIT_ENABLED"] and (methods is None or request.method in methods):
+                keys = []
+                if current_user.is_authenticated:
+                    keys.append(f"{scope}:user:{current_user.get_id()}")
+                if per_ip or not keys:
+                    keys.append(f"{scope}:ip:{request.remote_addr}")
+                store = get_bucket_store()
+                # Stop at the first full bucket so later ones are not charged
+                for key in keys:
+                    wait = store.take(key, refill, capacity)
+                    if wait:
+                        raise TooManyRequests(retry_after=math.ceil(wait))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def admit(priority):
+    """Admit the view at ``priority`` instead of the default NORMAL."""
+    def decorator(f):
+        f.admission_priority = priority
+        return f
+    return decorator
+
+
+class AdmissionMiddleware:
+    """Admits requests before Flask opens the session or loads the user.
+
+    Every non-static request takes a DB slot until its response has been
+    sent, so streamed responses keep theirs while streaming. Requests that
+    cannot be admitted get a 503 with a ``Retry-After`` header, without
+    touching the database.
+    """
+
+    def __init__(self, flask_app, wsgi_app):
+        self.flask_app = flask_app
+        self.wsgi_app = wsgi_app
+
+    def _priority(self, environ):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        if endpoint == 'static':
+            return None
+        view = self.flask_app.view_functions.get(endpoint)
+        return getattr(view, 'admission_priority', NORMAL)
+
+    def __call__(self, environ, start_response):
+        priority = self._priority(environ)
+        if priority is None:
+            return self.wsgi_app(environ, start_response)
+        controller = get_admission_controller()
+        if not controller.try_acquire(priority):
+            as_json = ('application/json' in environ.get('CONTENT_TYPE', '')
+                       or 'application/json' in environ.get('HTTP_ACCEPT', ''))
+            response = retry_later_response(
+                503, self.flask_app.config["ADMISSION_RETRY_AFTER"],
+                "We are receiving a lot of requests right now.", as_json)
+            return response(environ, start_response)
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+        except BaseException:
+            controller.release()
+            raise
+        return ClosingIterator(iterable, controller.release)
+
+
+app.wsgi_app = AdmissionMiddleware(app, app.wsgi_app)
@@ -25,12 +25,18 @@ login_manager = LoginManager(app)
 def load_user(user_id):
     return User.query.get(user_id)
 
+def get_browser_session_key():
+    # Created on first use so anonymous requests do not start a session
+    if '_browser_session_key' not in session:
+        session['_browser_session_key'] = uuid.uuid4().hex
+    return session['_browser_session_key']
+
 class UserSessionStorage(BaseStorage):
     def get(self, blueprint) -> dict | None:
         try:
             token = db.session.query(OAuth).filter_by(
                 user_id=current_user.get_id(),
-                browser_session_key=g.browser_session_key,
+                browser_session_key=get_browser_session_key(),
                 provider=blueprint.name,
             ).one().token
         except NoResultFound:
@@ -40,12 +46,12 @@ class UserSessionStorage(BaseStorage):
     def set(self, blueprint, token):
         db.session.query(OAuth).filter_by(
             user_id=current_user.get_id(),
-            browser_session_key=g.browser_session_key,
+            browser_session_key=get_browser_session_key(),
             provider=blueprint.name,
         ).delete()
         new_model = OAuth()
         new_model.user_id = current_user.get_id()
-        new_model.browser_session_key = g.browser_session_key
+        new_model.browser_session_key = get_browser_session_key()
         new_model.provider = blueprint.name
         new_model.token = token
         db.session.add(new_model)
@@ -54,7 +60,7 @@ class UserSessionStorage(BaseStorage):
     def delete(self, blueprint):
         db.session.query(OAuth).filter_by(
             user_id=current_user.get_id(),
-            browser_session_key=g.browser_session_key,
+            browser_session_key=get_browser_session_key(),
             provider=blueprint.name).delete()
         db.session.commit()
 
@@ -93,16 +99,15 @@ def make_replit_blueprint():
 
     @replit_bp.before_app_request
     def set_applocal_session():
-        if '_browser_session_key' not in session:
-            session['_browser_session_key'] = uuid.uuid4().hex
-        session.modified = True
-        g.browser_session_key = session['_browser_session_key']
+        if request.endpoint == 'static':
+            return
         g.flask_dance_replit = replit_bp.session
 
     @replit_bp.route("/logout")
     def logout():
         del replit_bp.token
         logout_user()
+        session.regenerate()
 
         end_session_endpoint = issuer_url + "/session/end"
         encoded_params = urlencode({
@@ -135,6 +140,8 @@ def logged_in(blueprint, token):
     user_claims = jwt.decode(token['id_token'], options={"verify_signature": False})
     user = save_user(user_claims)
     login_user(user)
+    # New session id on login to prevent session fixation
+    session.regenerate()
     blueprint.token = token
     next_url = session.pop("next_url", None)
     if next_url is not None:
@@ -2,16 +2,13 @@ from flask import render_template, request, redirect, url_for, flash, session, j
 from flask_login import current_user
 from app import app, db
 from replit_auth import require_login, make_replit_blueprint
+from rate_limit import rate_limit, admit, retry_later_response, CRITICAL, LOW
 from models import User, EmergencyContact, SOSAlert, SafetyResource, EducationalModule, UserProgress, GovernmentScheme, JobOpportunity, CommunityPost, CommunityReply
 from datetime import datetime
 import json
 
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
-@app.before_request
-def make_session_permanent():
-    session.permanent = True
-
 # Helper function to get user's preferred language
 def get_user_language():
     if current_user.is_authenticated and current_user.preferred_language:
@@ -54,6 +51,7 @@ def home():
                          safety_resources=safety_resources)
 
 @app.route('/sos')
+@admit(CRITICAL)
 @require_login
 def sos():
     # Get user's emergency contacts
@@ -61,7 +59,9 @@ def sos():
     return render_template('sos.html', emergency_contacts=emergency_contacts)
 
 @app.route('/activate_sos', methods=['POST'])
+@admit(CRITICAL)
 @require_login
+@rate_limit('sos', rate=10, per=60, per_ip=False)
 def activate_sos():
     try:
         data = request.get_json()
@@ -82,6 +82,7 @@ def activate_sos():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/cancel_sos', methods=['POST'])
+@admit(CRITICAL)
 @require_login
 def cancel_sos():
     try:
@@ -227,6 +228,7 @@ def employment():
                          selected_district=district)
 
 @app.route('/community')
+@admit(LOW)
 @require_login
 def community():
     category = request.args.get('category', 'all')
@@ -243,7 +245,9 @@ def community():
                          selected_category=category)
 
 @app.route('/community/new', methods=['GET', 'POST'])
+@admit(LOW)
 @require_login
+@rate_limit('community_post', rate=5, per=300, methods=['POST'])
 def new_community_post():
     if request.method == 'POST':
         title = request.form.get('title')
@@ -287,6 +291,7 @@ def update_profile():
 
 @app.route('/add_emergency_contact', methods=['POST'])
 @require_login
+@rate_limit('emergency_contact', rate=10, per=300)
 def add_emergency_contact():
     name = request.form.get('name')
     phone = request.form.get('phone')
@@ -311,9 +316,10 @@ def add_emergency_contact():
     return redirect(url_for('profile'))
 
 @app.route('/set_language/<lang>')
+@rate_limit('set_language', rate=10, per=60)
 def set_language(lang):
     session['language'] = lang
-    if current_user.is_authenticated:
+    if current_user.is_authenticated and current_user.preferred_language != lang:
         current_user.preferred_language = lang
         db.session.commit()
     return redirect(request.referrer or url_for('index'))
@@ -323,6 +329,12 @@ def set_language(lang):
 def not_found_error(error):
     return render_template('404.html'), 404
 
+@app.errorhandler(429)
+@app.errorhandler(503)
+def retry_later_error(error):
+    # Static body: a rejected request should not render base.html and load the user
+    return retry_later_response(error.code, error.retry_after, error.description, request.is_json)
+
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
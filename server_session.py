@@ -0,0 +1,350 @@
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from sqlalchemy import (
+    Column, Float, MetaData, String, Table, Text, bindparam, delete, insert, select, update,
+)
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session whose data lives in a store; the cookie only holds ``sid``."""
+
+    def __init__(self, initial=None, sid=None, raw=None, expires=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        # Serialized data as loaded, used to skip writes that change nothing
+        self.raw = raw
+        self.expires = expires
+        # Set by regenerate(); the record under this id is deleted on save
+        self.old_sid = None
+        self.modified = False
+        self.accessed = False
+
+    def regenerate(self):
+        """Move the data to a fresh session id, e.g. on login or logout."""
+        if self.sid is not None:
+            self.old_sid = self.sid
+            self.sid = None
+        self.modified = True
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class NullServerSideSession(ServerSideSession):
+    """Session for static files; Flask never saves it, so it adds no
+    ``Set-Cookie`` or ``Vary: Cookie``."""
+
+
+class BaseSessionStore:
+    """Backend holding serialized session data keyed by session id.
+
+    Subclass this to share sessions between hosts (e.g. Redis). Stores that
+    only live on one host must set ``shared = False``. Expiry times are UNIX
+    timestamps.
+    """
+
+    shared = True
+
+    def get(self, sid):
+        """Return ``(data, expires)`` for ``sid``, or None if unknown."""
+        raise NotImplementedError
+
+    def set(self, sid, data, expires):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    def touch(self, expiries):
+        """Update the expiry of many sessions given a ``{sid: expires}`` dict."""
+        raise NotImplementedError
+
+    def cleanup(self, now):
+        """Delete sessions that expired before ``now``."""
+        raise NotImplementedError
+
+
+class MemorySessionStore(BaseSessionStore):
+    """Process-local store, for development and tests."""
+
+    shared = False
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._sessions[sid] = (data, expires)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def touch(self, expiries):
+        with self._lock:
+            for sid, expires in expiries.items():
+                if sid in self._sessions:
+                    self._sessions[sid] = (self._sessions[sid][0], expires)
+
+    def cleanup(self, now):
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._sessions.items() if expires < now]
+            for sid in expired:
+                del self._sessions[sid]
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """Store backed by a SQLite file, shared by all workers on one host.
+
+    For development and tests; use DatabaseSessionStore when deployed.
+    """
+
+    shared = False
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            "SELECT data, expires FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, sid, data, expires):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                (sid, data, expires),
+            )
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def touch(self, expiries):
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE sessions SET expires = ? WHERE sid = ?",
+                [(expires, sid) for sid, expires in expiries.items()],
+            )
+
+    def cleanup(self, now):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+
+class DatabaseSessionStore(BaseSessionStore):
+    """Store in its own ``sessions`` table of a SQLAlchemy database.
+
+    Each call checks out its own pooled connection, so a request saving its
+    session may briefly hold two.
+    """
+
+    metadata = MetaData()
+    table = Table(
+        'sessions', metadata,
+        Column('sid', String(64), primary_key=True),
+        Column('data', Text, nullable=False),
+        Column('expires', Float, nullable=False, index=True),
+    )
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.metadata.create_all(engine)
+
+    def get(self, sid):
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.expires).where(self.table.c.sid == sid)
+            ).first()
+        return tuple(row) if row else None
+
+    def set(self, sid, data, expires):
+        values = {'data': data, 'expires': expires}
+        with self.engine.begin() as conn:
+            updated = conn.execute(update(self.table).where(self.table.c.sid == sid).values(values))
+            if updated.rowcount:
+                return
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(self.table).values(sid=sid, **values))
+        except IntegrityError:
+            # Inserted concurrently by another request for the same session
+            with self.engine.begin() as conn:
+                conn.execute(update(self.table).where(self.table.c.sid == sid).values(values))
+
+    def delete(self, sid):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.sid == sid))
+
+    def touch(self, expiries):
+        stmt = (update(self.table)
+                .where(self.table.c.sid == bindparam('b_sid'))
+                .values(expires=bindparam('b_expires')))
+        with self.engine.begin() as conn:
+            conn.execute(stmt, [{'b_sid': sid, 'b_expires': expires}
+                                for sid, expires in expiries.items()])
+
+    def cleanup(self, now):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.expires < now))
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in the ``SESSION_STORE`` config value and only an
+    opaque id in the cookie.
+
+    Data is written only when it actually changes. Expiry is refreshed at most
+    once per ``SESSION_REFRESH_INTERVAL`` seconds per session, and refreshes
+    are queued and written to the store in batches. Expired sessions are
+    deleted every ``SESSION_CLEANUP_INTERVAL`` seconds.
+    """
+
+    serializer = session_json_serializer
+    null_session_class = NullServerSideSession
+
+    def __init__(self):
+        self._pending = {}
+        self._last_flush = time.time()
+        self._last_cleanup = time.time()
+        self._lock = threading.Lock()
+
+    def get_store(self, app):
+        return app.config["SESSION_STORE"]
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        # Static files never use the session, so skip the store round trip
+        if app.static_url_path and request.path.startswith(app.static_url_path + '/'):
+            return self.null_session_class()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.get_store(app).get(sid)
+            if record is not None:
+                raw, expires = record
+                expires = self._pending.get(sid, expires)
+                if expires > time.time():
+                    return ServerSideSession(self.serializer.loads(raw), sid, raw, expires)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        partitioned = self.get_cookie_partitioned(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        store = self.get_store(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.old_sid is not None:
+            store.delete(session.old_sid)
+            with self._lock:
+                self._pending.pop(session.old_sid, None)
+
+        if not session:
+            if session.modified and (session.sid or session.old_sid) is not None:
+                if session.sid is not None:
+                    store.delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure,
+                    partitioned=partitioned, samesite=samesite, httponly=httponly,
+                )
+                response.vary.add("Cookie")
+            return
+
+        now = time.time()
+        lifetime = self._lifetime(app)
+        refresh_interval = app.config["SESSION_REFRESH_INTERVAL"]
+
+        if session.sid is None and app.config["SESSION_PERMANENT"]:
+            # Set with the first write so that response already sends Expires
+            session.permanent = True
+        raw = self.serializer.dumps(dict(session)) if session.modified else session.raw
+        if session.sid is None or raw != session.raw:
+            session.sid = session.sid or secrets.token_urlsafe(32)
+            session.expires = now + lifetime
+            store.set(session.sid, raw, session.expires)
+            with self._lock:
+                self._pending.pop(session.sid, None)
+        elif session.expires - now < lifetime - refresh_interval:
+            session.expires = now + lifetime
+            self._queue_touch(app, store, session.sid, session.expires)
+        else:
+            return
+        self._maybe_cleanup(app, store, now)
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            partitioned=partitioned,
+            samesite=samesite,
+        )
+        response.vary.add("Cookie")
+
+    def _queue_touch(self, app, store, sid, expires):
+        with self._lock:
+            self._pending[sid] = expires
+            due = (len(self._pending) >= app.config["SESSION_TOUCH_BATCH_SIZE"]
+                   or time.time() - self._last_flush >= app.config["SESSION_REFRESH_INTERVAL"])
+            if not due:
+                return
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+        store.touch(pending)
+
+    def _maybe_cleanup(self, app, store, now):
+        with self._lock:
+            if now - self._last_cleanup < app.config["SESSION_CLEANUP_INTERVAL"]:
+                return
+            self._last_cleanup = now
+        store.cleanup(now)